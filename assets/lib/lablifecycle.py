@@ -0,0 +1,203 @@
+import gc
+import os
+import sys
+import weakref
+
+from ipywidgets import Widget
+
+
+def weak_handler(method):
+    """
+    Wraps a bound method into an event handler which only holds a weak reference to its object.
+    Widgets observing the handler then do not keep the lab alive: once the lab is discarded, the handler does nothing.
+
+    :method: bound method to call on each event
+
+    :returns: the event handler
+    """
+    reference = weakref.WeakMethod(method)
+
+    def handler(*args, **kwargs):
+        method = reference()
+        if method is not None:
+            return method(*args, **kwargs)
+
+    return handler
+
+
+def close_widgets(observers, widgets):
+    """
+    Unlinks the handlers from the widgets, then closes the widgets and their layout and style (which removes them from the registry of ipywidgets).
+
+    :observers: list of (widget, handler, names) linked with widget.observe
+    :widgets: list of widgets to close
+    """
+    for widget, handler, names in observers:
+        try:
+            widget.unobserve(handler, names=names)
+        except ValueError:
+            pass
+    for widget in widgets:
+        for attribute in ('layout', 'style'):
+            if isinstance(getattr(widget, attribute, None), Widget):
+                getattr(widget, attribute).close()
+        widget.close()
+
+
+# Labs whose interface is displayed, by slot: slot -> (execution, labs displayed by this execution).
+# The registry keeps them (and their handlers) alive even if the notebook keeps no reference to them, e.g. SuspendedObjectLab().launch(),
+# until they are closed, or replaced by the labs displayed by a later execution of the same slot (see LabLifecycle.keep_open).
+open_labs = {}
+
+
+def current_execution():
+    """
+    Identifies the notebook cell being executed, as far as the frontend tells it to the kernel.
+
+    :returns: tuple (id of the cell, execution count), each None if unknown (e.g. the classic Notebook does not send the id of the cells, and there is no execution count outside IPython)
+    """
+    try:
+        from IPython import get_ipython
+        shell = get_ipython()
+    except ImportError:
+        shell = None
+    if shell is None:
+        return None, None
+
+    header = getattr(shell, 'parent_header', None) or {}
+    return header.get('metadata', {}).get('cellId'), getattr(shell, 'execution_count', None)
+
+
+class LabLifecycle:
+    """
+    Base class of the labs, which owns the widgets and the other resources of their interface.
+    A displayed lab stays alive until it is closed, explicitly with close() or at the end of a with statement,
+    or until the cell which displayed it is executed again and displays a new lab (which replaces it, as its output does).
+    """
+
+    def __init__(self):
+        self.observers = [] # (widget, handler, names) linked with widget.observe
+        self.widgets = [] # widgets to close
+        self.cleanups = [] # (function, args) called when the lab is closed
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def observe(self, widget, method, names):
+        """
+        Links a method of the lab to the changes of a widget, until the lab is closed.
+
+        :widget: widget to observe
+        :method: bound method called on each change (weakly referenced, see weak_handler)
+        :names: names of the traits to observe
+        """
+        handler = weak_handler(method)
+        widget.observe(handler, names=names)
+        self.observers.append((widget, handler, names))
+
+
+    def own(self, *widgets):
+        """
+        Registers widgets to close when the lab is closed.
+        """
+        self.widgets.extend(widgets)
+
+
+    def on_close(self, function, *args):
+        """
+        Registers a function to call (with the given arguments) when the lab is closed.
+        """
+        self.cleanups.append((function, args))
+
+
+    def keep_open(self):
+        """
+        Keeps the lab alive while its interface is displayed.
+        The labs displayed by a previous execution of the same cell are closed: re-running a cell replaces its output, and with it their interface.
+        When the cell is unknown, the slot is the class of the lab, so that at most one execution keeps labs of each class open.
+        """
+        cell, execution = current_execution()
+        slot = type(self) if cell is None else cell
+
+        previous_execution, labs = open_labs.get(slot, (None, []))
+        if execution is None or execution != previous_execution:
+            for lab in list(labs):
+                if lab is not self:
+                    lab.close()
+
+        labs = open_labs.get(slot, (None, []))[1]
+        if self not in labs:
+            labs.append(self)
+        open_labs[slot] = (execution, labs)
+
+
+    def close(self):
+        '''
+        Releases the widgets and the other resources of the lab.
+        '''
+        close_widgets(self.observers, self.widgets)
+        self.observers.clear()
+        self.widgets.clear()
+
+        cleanups, self.cleanups = self.cleanups, []
+        for function, args in cleanups:
+            function(*args)
+
+        for slot, (execution, labs) in list(open_labs.items()):
+            if self in labs:
+                labs.remove(self)
+                if not labs:
+                    del open_labs[slot]
+
+
+def current_rss():
+    """
+    Returns the resident set size of the current process, in bytes.
+    """
+    try:
+        # Linux: the second field of statm is the resident size, in pages
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        # fall back on the peak resident size, which still grows if memory leaks
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def measure_rss_growth(build, n=1000, warmup=200):
+    """
+    Builds and closes n labs, and measures how much the resident memory of the process grew.
+    Labs are built first so that caches, lazy imports and the pools of the allocator (filled by the first few hundred labs) do not count as growth.
+
+    :build: function building and closing one lab
+    :n: number of labs to build
+    :warmup: number of labs built before the measure
+
+    :returns: growth of the resident set size, in bytes
+    """
+    for _ in range(warmup):
+        build()
+    gc.collect()
+    before = current_rss()
+
+    for _ in range(n):
+        build()
+    gc.collect()
+
+    return current_rss() - before
+
+
+# EOF
@@ -13,20 +13,58 @@ from IPython.display import set_matplotlib_formats, display, Math, Markdown, Lat
 set_matplotlib_formats('svg')
 
 from bokeh.io import push_notebook, show, output_notebook, curdoc
+from bokeh.io.state import curstate
 from bokeh.plotting import figure
 from bokeh.models import Legend, ColumnDataSource, Slider, Span, LegendItem
-from bokeh.models import Arrow, OpenHead, NormalHead, VeeHead, LabelSet
+from bokeh.models import Arrow, OpenHead, NormalHead, VeeHead, LabelSet, CustomJSTransform
+from bokeh.transform import transform
 from bokeh.models.glyphs import Wedge, Bezier
 from bokeh.layouts import gridplot, row, column
+from bokeh.palettes import viridis
+
+from .suspendedobjectsolver import get_object_heights
+from .lablifecycle import LabLifecycle
 
 output_notebook(hide_banner=True)
 
-class SuspendedObjectLab:
+
+def release_document(root, handle):
+    """
+    Releases a root displayed with show(root, notebook_handle=True).
+    show() adds the root to the current document, and registers the notebook handle (holding a copy of the document) on it.
+
+    :root: displayed root
+    :handle: notebook handle returned by show (None outside notebooks)
+    """
+    if handle is not None:
+        document = curstate().document
+        try:
+            document.remove_on_change(handle)
+        except KeyError:
+            pass
+        if handle.comms is not None:
+            handle.comms.close()
+        if curstate().last_comms_handle is handle:
+            curstate().last_comms_handle = None
+
+    root_document = root.document
+    if root_document is not None:
+        models = root.references()
+        root_document.remove_root(root)
+        # the document also remembers the ids of all the models it has ever contained
+        seen = getattr(root_document.models, '_seen_model_ids', None)
+        if isinstance(seen, set):
+            seen.difference_update(model.id for model in models)
+
+
+class SuspendedObjectLab(LabLifecycle):
     """
     This class embeds all the necessary code to create a virtual lab to study the static equilibrium of an object suspended on a clothesline with a counterweight.
+    Once displayed, the lab stays alive (with its interface working) until it is closed with close() or at the end of a with statement,
+    or replaced by a new lab displayed by the same cell when it is executed again.
     """
     
-    def __init__(self, m_object = 3, distance = 5, height = 1.5, x_origin = 0, y_origin = 0):
+    def __init__(self, m_object = 3, distance = 5, height = 1.5, x_origin = 0, y_origin = 0, history_length = 0):
         '''
         Initiates and displays the virtual lab on suspended objects.
         
@@ -35,7 +73,9 @@ class SuspendedObjectLab:
         :height: height of the poles (same height for both)
         :x_origin: x coordinate of the bottom of the left pole (origin of the coordinate system)
         :y_origin: y coordinate of the bottom of the left pole (origin of the coordinate system)
+        :history_length: number of previous states of the object shown as a fading trail (0 to disable)
         '''
+        super().__init__()
         
         ###--- Static parameters of the situation
         self.m_object = m_object # mass of the wet object, in kg
@@ -46,6 +86,8 @@ class SuspendedObjectLab:
         self.x_origin = x_origin # x coordinate of point of origin of the figure = x position of the left pole, in m
         self.y_origin = y_origin # y coordinate of point of origin of the figure = y position of the lower point (ground), in m
 
+        self.history_length = history_length # number of previous states shown in the trail
+
 
         # Parameters for drawing forces
         self.gravity = 9.81
@@ -60,9 +102,23 @@ class SuspendedObjectLab:
         # parameter to draw the angle
         self.radius=0.3
 
-    
+        # notebook handle of the interface displayed by launch()
+        self.handle = None
+
+
+    def close(self):
+        '''
+        Releases the widgets and the Bokeh documents created by the lab. The lab can be launched again afterwards.
+        '''
+        super().close()
+        self.handle = None
+
+
     def launch(self):
         
+        # launching again replaces the previous interface
+        self.close()
+        
         ###--- Elements of the ihm:
         # IHM input elements
         self.alpha_slider_label = Label('Angle α (°):', layout=Layout(margin='0px 5px 0px 0px'))
@@ -72,7 +128,8 @@ class SuspendedObjectLab:
         self.alpha_slider_input = VBox([HBox([self.alpha_slider_label, self.alpha_slider_widget], layout=Layout(margin='0px')), self.alpha_slider_note])
 
         # Linking widgets to handlers
-        self.alpha_slider_widget.observe(self.alpha_slider_event_handler, names='value')
+        self.observe(self.alpha_slider_widget, self.alpha_slider_event_handler, 'value')
+        self.own(self.alpha_slider_label, self.alpha_slider_widget, self.alpha_slider_note, self.alpha_slider_input.children[0], self.alpha_slider_input)
 
 
         ###--- Compute variables dependent with alpha
@@ -82,6 +139,10 @@ class SuspendedObjectLab:
         coord_object = self.get_object_coords(alpha)
         height_text =  'h = {:.2f} m'.format(coord_object[1])
 
+        # on the ground, the tension is not defined: None is sent as null (JSON has no NaN), which Bokeh does not draw
+        tension = self.get_tension(alpha)
+        tension, tension_text = (float(tension), 'T = {:.1f} N'.format(tension)) if np.isfinite(tension) else (None, '')
+
         
         ###--- Create the figure ---###
         # LIMITATIONS of Bokeh (BokehJS 1.4.0)
@@ -124,8 +185,10 @@ class SuspendedObjectLab:
             x=[coord_object[0]],
             y=[coord_object[1]],
             alpha_degrees=[self.alpha_degrees],
+            tension=[tension],
             height_text=[height_text],
-            alpha_text=[alpha_text]
+            alpha_text=[alpha_text],
+            tension_text=[tension_text]
         ))
         fig_object.circle(source=self.object_source, x='x', y='y', size=8, fill_color="black", line_color='black', line_width=2)
         fig_object.add_layout(LabelSet(source=self.object_source, x='x', y='y', text='height_text', level='glyph', x_offset=8, y_offset=-20))
@@ -193,9 +256,59 @@ class SuspendedObjectLab:
         fig_object.line(source=self.proj_source, x='x', y='y', color="gray", line_width=1, line_dash="dashed")
 
         
+        # --DYN-- Draw the trail of the previous positions of the object and forces
+        # The source keeps at most history_length states (rollover), and the opacity of each state is computed in the browser from its step
+        self.history_step = 0
+        self.history_source = None
+        if self.history_length > 0:
+            self.history_source = ColumnDataSource(data=dict(step=[], x=[], y=[], x_weight=[], y_weight=[], x_right=[], x_left=[], y_tension=[]))
+            fade = CustomJSTransform(args=dict(length=self.history_length), v_func='''
+                let last = -Infinity
+                for (const step of xs) last = Math.max(last, step)
+                return xs.map((step) => 0.4 * (length - (last - step)) / length)
+            ''')
+            fig_object.segment(source=self.history_source, x0='x', y0='y', x1='x_weight', y1='y_weight', line_color='blue', line_width=1, line_alpha=transform('step', fade))
+            fig_object.segment(source=self.history_source, x0='x', y0='y', x1='x_right', y1='y_tension', line_color='red', line_width=1, line_alpha=transform('step', fade))
+            fig_object.segment(source=self.history_source, x0='x', y0='y', x1='x_left', y1='y_tension', line_color='red', line_width=1, line_alpha=transform('step', fade))
+            fig_object.circle(source=self.history_source, x='x', y='y', size=6, fill_color='black', line_color=None, fill_alpha=transform('step', fade))
+            self.add_history(coord_object, Fy, Tx, Ty)
+
+        
+        ###--- Then display the height and the tension as functions of the angle
+        # The curves are computed once for all the angles of the slider
+        alphas_degrees = np.linspace(self.alpha_slider_min, self.alpha_slider_max, 200)
+        alphas = degrees_to_radians(alphas_degrees)
+        curves_source = ColumnDataSource(data=dict(
+            alpha_degrees=alphas_degrees,
+            height=get_object_heights(alphas, self.distance, self.height, self.y_origin),
+            tension=self.get_tension(alphas)
+        ))
+
+        fig_height = figure(title='Height (m)', plot_width=400, plot_height=250, x_range=(self.alpha_slider_min, self.alpha_slider_max), 
+                            background_fill_color='#ffffff', toolbar_location=None)
+        fig_tension = figure(title='Tension (N)', plot_width=400, plot_height=250, x_range=fig_height.x_range, y_axis_type='log', 
+                             background_fill_color='#ffffff', toolbar_location=None)
+        for fig, curve, state, text in [(fig_height, 'height', 'y', 'height_text'), (fig_tension, 'tension', 'tension', 'tension_text')]:
+            fig.title.align = "center"
+            fig.xaxis.axis_label = 'Angle α (°)'
+            fig.line(source=curves_source, x='alpha_degrees', y=curve, color="green", line_width=2)
+            
+            # --DYN-- Current state, read from the same source as the object on the clothesline
+            fig.circle(source=self.object_source, x='alpha_degrees', y=state, size=8, fill_color="black", line_color='black', line_width=2)
+            fig.add_layout(LabelSet(source=self.object_source, x='alpha_degrees', y=state, text=text, level='glyph', x_offset=8, y_offset=5))
+
+        # Draw the horizon line
+        fig_height.add_layout(Span(location=self.y_origin+self.height, dimension='width', line_color='gray', line_dash='dashed', line_width=1))
+
+        
         ###--- Display the whole interface
-        show(row(children=[fig_object]), notebook_handle=True)
-        display(VBox([self.alpha_slider_input]))
+        root = column(children=[fig_object, row(children=[fig_height, fig_tension])])
+        self.handle = show(root, notebook_handle=True)
+        self.on_close(release_document, root, self.handle)
+        interface = VBox([self.alpha_slider_input])
+        self.own(interface)
+        display(interface)
+        self.keep_open()
         
 
     # Event handlers
@@ -214,14 +327,20 @@ class SuspendedObjectLab:
         Tx = ((self.m_object*self.gravity) / (2*np.tan(alpha)))*self.force_scaling
         self.forces_x_mag = [0, Tx, 0, -Tx]    
 
-        # update the object representation on all graphs (coordinates+labels)
-        self.object_source.data = dict(
-            x=[coord_object[0]],
-            y=[coord_object[1]],
-            alpha_degrees=[self.alpha_degrees],
-            height_text=[height_text],
-            alpha_text=[alpha_text]
-        )
+        # on the ground, the tension is not defined: None is sent as null (JSON has no NaN), which Bokeh does not draw
+        tension = self.get_tension(alpha)
+        tension, tension_text = (float(tension), 'T = {:.1f} N'.format(tension)) if np.isfinite(tension) else (None, '')
+
+        # update the object representation on all graphs (coordinates+labels) with a single patch
+        self.object_source.patch({
+            'x' : [(0, coord_object[0])],
+            'y' : [(0, coord_object[1])],
+            'alpha_degrees' : [(0, self.alpha_degrees)],
+            'tension' : [(0, tension)],
+            'height_text' : [(0, height_text)],
+            'alpha_text' : [(0, alpha_text)],
+            'tension_text' : [(0, tension_text)]
+        })
 
         # update line representing the angle alpha
         self.alpha_arc.data_source.patch({
@@ -248,12 +367,50 @@ class SuspendedObjectLab:
             'y' : [(slice(3), self.forces_source.data["y_end"][1:4])]
         })
 
-        push_notebook()
+        # add the new state to the trail
+        if self.history_source is not None:
+            self.add_history(coord_object, self.m_object*self.gravity*self.force_scaling, Tx, .5*self.m_object*self.gravity*self.force_scaling)
+
+        push_notebook(handle=self.handle)
+        
+        
+    def add_history(self, coord_object, Fy, Tx, Ty):
+        '''
+        Appends a state of the object to the trail (only the last history_length states are kept).
         
+        :coord_object: coordinates of the object
+        :Fy: scaled weight
+        :Tx: scaled horizontal component of the tension
+        :Ty: scaled vertical component of the tension
+        '''
+        self.history_source.stream(dict(
+            step=[self.history_step],
+            x=[coord_object[0]],
+            y=[coord_object[1]],
+            x_weight=[coord_object[0]],
+            y_weight=[coord_object[1]-Fy],
+            x_right=[coord_object[0]+Tx],
+            x_left=[coord_object[0]-Tx],
+            y_tension=[coord_object[1]+Ty]
+        ), rollover=self.history_length)
+        self.history_step += 1
         
         
         
-    def visualize_angle(self, angle_degrees):
+        
+    def visualize_angle(self, angle_degrees, layout='overlay', ncols=4):
+        '''
+        Displays the situation for the given angle.
+        
+        :angle_degrees: angle that the cable makes with the horizon, in degrees (or an array of angles to compare several situations)
+        :layout: for an array of angles, 'overlay' draws all situations on the same clothesline, 'grid' draws them as small multiples
+        :ncols: number of columns of the grid of small multiples
+        '''
+        
+        # several angles: all situations are drawn at once in a single figure
+        if np.ndim(angle_degrees) > 0:
+            self.visualize_angles(angle_degrees, layout=layout, ncols=ncols)
+            return
         
         ### first let's validate the angle
         # it cannot be null (i.e. cable horizontal) or negative
@@ -389,7 +546,200 @@ class SuspendedObjectLab:
 
         
         ###--- Display the whole interface
-        show(row(children=[fig_object]), notebook_handle=True) #, sizing_mode="scale_both"
+        root = row(children=[fig_object])
+        self.on_close(release_document, root, show(root, notebook_handle=True)) #, sizing_mode="scale_both"
+        self.keep_open()
+        
+
+    def visualize_angles(self, angles_degrees, layout='overlay', ncols=4):
+        '''
+        Displays the situations for several angles in a single figure, either overlaid on the same clothesline or as a grid of small multiples.
+        Each kind of element (cables, points, forces, ...) is drawn with a single glyph backed by a single data source, whatever the number of angles.
+        
+        :angles_degrees: angles that the cable makes with the horizon, in degrees
+        :layout: 'overlay' or 'grid'
+        :ncols: number of columns of the grid of small multiples
+        '''
+        
+        if layout not in ('overlay', 'grid'):
+            print(f"\033[1m\x1b[91m Unknown layout '{layout}': use 'overlay' or 'grid'. \x1b[0m\033[0m")
+            return
+        
+        ### first let's validate the angles
+        angles_degrees = np.asarray(angles_degrees, dtype=float).ravel()
+
+        # they cannot be null (i.e. cable horizontal) or negative
+        if np.any(angles_degrees <= 0):
+            print("\033[1m\x1b[91m The angles cannot be null or negative: {} ignored. \x1b[0m\033[0m".format(', '.join('{:.2f}'.format(a) for a in angles_degrees[angles_degrees <= 0])))
+            angles_degrees = angles_degrees[angles_degrees > 0]
+        if angles_degrees.size == 0:
+            return
+
+        # they cannot be more than the default angle given the parameters of the situation
+        alpha_default = np.arctan(self.height / (self.distance / 2))
+        alpha_default_degrees = radians_to_degrees(alpha_default)
+        if np.any(angles_degrees > alpha_default_degrees):
+            print(f"\033[1m\x1b[91m The angles cannot be greater than {alpha_default_degrees:.2f} degrees given the parameters of this situation (poles of {self.height} meters, distant by {self.distance} meters). \x1b[0m\033[0m")
+            angles_degrees = np.minimum(angles_degrees, alpha_default_degrees)
+
+        
+        # compute variables dependent with the angles selected by the user (all at once)
+        n = angles_degrees.size
+        alpha = degrees_to_radians(angles_degrees)
+        alpha_text = ['⍺ = {:.2f} °'.format(a) for a in angles_degrees]
+        
+        y_object = get_object_heights(alpha, self.distance, self.height, self.y_origin)
+        height_text = ['h = {:.2f} m'.format(y) for y in y_object]
+        colors = viridis(n) if n > 1 else ['black']
+
+        
+        ###--- Position of each situation in the figure
+        ymargin = .05
+        xmargin = .2
+        if layout == 'grid':
+            ncols = max(1, min(ncols, n))
+            nrows = int(np.ceil(n / ncols))
+            tile_width = self.distance + 4*xmargin
+            tile_height = self.height + 6*ymargin
+            # offsets of the origin of each situation (one tile per angle, from top left to bottom right)
+            dx = (np.arange(n) % ncols) * tile_width
+            dy = -(np.arange(n) // ncols) * tile_height
+            # offsets of the scenery (poles, ground, horizon) drawn once per tile
+            scenery_dx, scenery_dy = dx, dy
+            plot_width, plot_height = 800, max(200, int(400 * nrows / ncols))
+        else:
+            nrows, ncols = 1, 1
+            tile_width = tile_height = 0
+            dx = np.zeros(n)
+            dy = np.zeros(n)
+            scenery_dx, scenery_dy = np.zeros(1), np.zeros(1)
+            plot_width, plot_height = 800, 400
+
+        x_left = self.x_origin + scenery_dx
+        x_right = self.x_origin + self.distance + scenery_dx
+        y_ground = self.y_origin + scenery_dy
+        y_top = self.y_origin + self.height + scenery_dy
+        
+        
+        ###--- Create the figure ---###
+        fig_object = figure(title='Suspended object ({} kg)'.format(self.m_object), plot_width=plot_width, plot_height=plot_height, 
+                            y_range=(self.y_origin-ymargin-(nrows-1)*tile_height, self.y_origin+self.height+ymargin), 
+                            x_range=(self.x_origin-xmargin, self.x_origin+self.distance+xmargin+(ncols-1)*tile_width), 
+                            background_fill_color='#ffffff', toolbar_location=None)
+        fig_object.title.align = "center"
+        fig_object.yaxis.axis_label = 'Height (m)'
+        fig_object.xaxis.axis_label = "Distance (m)"
+
+        # Customize graph style so that it doesn't look too much like a graph
+        fig_object.ygrid.visible = False
+        fig_object.xgrid.visible = False
+        fig_object.outline_line_color = None
+        if layout == 'grid':
+            # the axes only make sense for one tile
+            fig_object.xaxis.visible = False
+            fig_object.yaxis.visible = False
+
+        
+        # Draw the horizon lines
+        fig_object.segment(x0=x_left-xmargin, y0=y_top, x1=x_right+xmargin, y1=y_top, line_color='gray', line_dash='dashed', line_width=1)
+        
+        # Draw the poles
+        fig_object.segment(x0=np.concatenate([x_left, x_right]), y0=np.concatenate([y_ground, y_ground]), x1=np.concatenate([x_left, x_right]), y1=np.concatenate([y_top, y_top]), 
+                           color="black", line_width=8, line_cap="round")
+        
+        # Draw the ground
+        fig_object.segment(x0=x_left-xmargin, y0=y_ground, x1=x_right+xmargin, y1=y_ground, line_color='black', line_width=1)
+        fig_object.hbar(y=y_ground-ymargin, height=ymargin*2, left=x_left-xmargin, right=x_right+xmargin, color="white", line_color="white", hatch_pattern="/", hatch_color="gray")
+
+        
+        # Draw the points at which the object is suspended
+        x_object = self.x_origin + 0.5*self.distance + dx
+        y_object = y_object + dy
+        self.objects_source = ColumnDataSource(data=dict(
+            x=x_object,
+            y=y_object,
+            alpha_degrees=angles_degrees,
+            height_text=height_text,
+            alpha_text=alpha_text,
+            text=[h if layout == 'grid' else '{}, {}'.format(a, h) for a, h in zip(alpha_text, height_text)],
+            color=colors
+        ))
+        fig_object.circle(source=self.objects_source, x='x', y='y', size=8, fill_color='color', line_color='color', line_width=2)
+        fig_object.add_layout(LabelSet(source=self.objects_source, x='x', y='y', text='text', text_color='color', level='glyph', x_offset=8, y_offset=-35))
+
+        # Draw the hanging cables
+        self.cables_source = ColumnDataSource(data=dict(
+            xs=list(np.column_stack([self.x_origin+dx, x_object, self.x_origin+self.distance+dx])),
+            ys=list(np.column_stack([self.y_origin+self.height+dy, y_object, self.y_origin+self.height+dy])),
+            color=colors
+        ))
+        fig_object.multi_line(source=self.cables_source, xs='xs', ys='ys', line_color='color', line_width=2, line_cap="round")
+
+        
+        # Draw the angles between the hanging cables and horizonline (straight lines, see visualize_angle)
+        ratio=1.5
+        self.alpha_arcs_source = ColumnDataSource(data=dict(
+            x0=self.x_origin+ratio*self.radius+dx,
+            y0=self.y_origin+self.height+dy,
+            x1=self.x_origin+self.radius*np.cos(alpha)+dx,
+            y1=self.y_origin+self.height-self.radius*np.sin(alpha)+dy,
+            alpha_text=alpha_text,
+            color=colors
+        ))
+        fig_object.segment(source=self.alpha_arcs_source, x0='x0', y0='y0', x1='x1', y1='y1', line_color='color', line_width=1, line_dash="2 2")
+        if layout == 'grid':
+            fig_object.add_layout(LabelSet(source=self.alpha_arcs_source, x='x0', y='y0', text='alpha_text', level='glyph', x_offset=20, y_offset=-20))
+
+        
+        # Draw the force vectors: 4 consecutive rows (F, T, Tr, T) per angle
+        # Weight
+        Fy = self.m_object*self.gravity*self.force_scaling
+        # Tension
+        Tx = ((self.m_object*self.gravity) / (2*np.tan(alpha)))*self.force_scaling
+        Ty = .5*self.m_object*self.gravity*self.force_scaling
+
+        forces_x_start = np.repeat(x_object, self.forces_nb)
+        forces_y_start = np.repeat(y_object, self.forces_nb)
+        forces_x_mag = np.column_stack([np.zeros(n), Tx, np.zeros(n), -Tx]).ravel()
+        forces_y_mag = np.tile([-Fy, Ty, Fy, Ty], n)
+
+        self.forces_source = ColumnDataSource(data=dict(
+            x_start=forces_x_start,
+            y_start=forces_y_start,
+            x_end=forces_x_start + forces_x_mag,
+            y_end=forces_y_start + forces_y_mag,
+            name=["F", "T", "Tr", "T"]*n,
+            color=["blue", "red", "gray", "red"]*n,
+            x_offset=[8, 15, 8, -25]*n,
+            y_offset=[-64, -16, 45, -16]*n
+        ))
+        
+        # Draw the arrows
+        forces_arrows = Arrow(source=self.forces_source, x_start='x_start', y_start='y_start', x_end='x_end', y_end='y_end', 
+                   line_color='color', line_width=2, end=OpenHead(line_width=2, size=12))
+        fig_object.add_layout(forces_arrows)
+
+        # Add the labels (only on small multiples, they would overlap on the overlay)
+        if layout == 'grid':
+            forces_labels = LabelSet(source=self.forces_source, x='x_start', y='y_start', text='name', text_color='color', level='glyph', 
+                                     x_offset='x_offset', y_offset='y_offset', render_mode='canvas')
+            fig_object.add_layout(forces_labels)
+        
+        
+        # Draw the tension projection lines (end of T, Tr and the other T for each angle)
+        x_end = self.forces_source.data["x_end"].reshape(n, self.forces_nb)
+        y_end = self.forces_source.data["y_end"].reshape(n, self.forces_nb)
+        self.projs_source = ColumnDataSource(data=dict(
+            xs=list(x_end[:, 1:4]),
+            ys=list(y_end[:, 1:4])
+        ))
+        fig_object.multi_line(source=self.projs_source, xs='xs', ys='ys', color="gray", line_width=1, line_dash="dashed")
+
+        
+        ###--- Display the whole interface
+        root = row(children=[fig_object])
+        self.on_close(release_document, root, show(root, notebook_handle=True))
+        self.keep_open()
         
 
     # Utility functions
@@ -420,6 +770,19 @@ class SuspendedObjectLab:
         return min(alpha_default, alpha)
 
 
+    def get_tension(self, angle):
+        """
+        Computes the norm of the tension in the cable: T = m_object * g / (2 * sin(angle))
+        The tension is not defined (NaN) for angles at or above arctan(height / (distance / 2)), where the object rests on the ground.
+
+        :angle: angle(s) that the cable makes with the horizon, in radians
+
+        :returns: norm of the tension (in N)
+        """
+        alpha_default = np.arctan(self.height / (self.distance / 2))
+        return np.where(np.asarray(angle) < alpha_default, self.m_object * self.gravity / (2 * np.sin(angle)), np.nan)[()]
+
+
     def get_object_coords(self, angle):
         """
         Computes the position of the object on the cable taking into account the angle determined by the counterweight and the dimensions of the hanging system.
@@ -0,0 +1,180 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from .suspendedobjectsolver import get_angles, get_object_heights
+
+
+# Outputs of the model propagated by the analysis
+OUTPUTS = ['angle', 'height']
+
+
+def sample_inputs(rng, n, m_object, m_counterweight, distance, height):
+    """
+    Draws n samples of the measured parameters of the situation.
+    Each parameter is either a value (known exactly) or a pair (value, standard deviation) of a normally distributed measurement.
+    Masses and lengths cannot be negative: the normal distributions are truncated to positive values (non-positive samples are drawn again).
+
+    :rng: numpy random generator
+    :n: number of samples
+
+    :returns: tuple of the sampled m_object, m_counterweight, distance and height
+    """
+    samples = []
+    for parameter in (m_object, m_counterweight, distance, height):
+        value, std = parameter if np.ndim(parameter) > 0 else (parameter, 0)
+        if std > 0:
+            sample = rng.normal(value, std, n)
+            invalid = sample <= 0
+            while invalid.any():
+                sample[invalid] = rng.normal(value, std, np.count_nonzero(invalid))
+                invalid = sample <= 0
+        else:
+            sample = np.full(n, float(value))
+        samples.append(sample)
+    return tuple(samples)
+
+
+def evaluate(m_object, m_counterweight, distance, height, y_origin=0):
+    """
+    Computes the outputs of the model (vectorized) for the given parameters.
+
+    :returns: dict with the angle (in degrees) and the height (in m) of the object
+    """
+    with np.errstate(divide='ignore', invalid='ignore'):
+        angle = get_angles(m_counterweight, m_object, distance, height)
+        return dict(angle=np.degrees(angle), height=get_object_heights(angle, distance, height, y_origin))
+
+
+def simulate_chunk(task):
+    """
+    Simulates one chunk of samples and summarizes it (run in the worker processes).
+
+    :task: tuple (seed sequence, number of samples, parameters, histogram edges of each output)
+
+    :returns: dict with, for each output, the count, mean, sum of squared deviations (m2), min, max and histogram of the chunk
+    """
+    seed, n, parameters, edges = task
+    rng = np.random.default_rng(seed)
+    outputs = evaluate(*sample_inputs(rng, n, *parameters[:4]), y_origin=parameters[4])
+
+    summary = {}
+    for name, values in outputs.items():
+        values = values[np.isfinite(values)]
+        mean = values.mean() if values.size else 0.
+        counts = np.histogram(values, bins=edges[name])[0]
+        summary[name] = dict(
+            count=values.size,
+            mean=mean,
+            m2=((values - mean)**2).sum(),
+            min=values.min() if values.size else np.inf,
+            max=values.max() if values.size else -np.inf,
+            histogram=counts,
+            underflow=np.count_nonzero(values < edges[name][0]),
+            overflow=np.count_nonzero(values > edges[name][-1])
+        )
+    return summary
+
+
+def merge_summaries(a, b):
+    """
+    Merges the summaries of two chunks of samples (parallel variant of Welford's algorithm for the variance).
+
+    :returns: summary of the union of both chunks
+    """
+    count = a['count'] + b['count']
+    if count == 0:
+        return a
+    delta = b['mean'] - a['mean']
+    return dict(
+        count=count,
+        mean=a['mean'] + delta * b['count'] / count,
+        m2=a['m2'] + b['m2'] + delta**2 * a['count'] * b['count'] / count,
+        min=min(a['min'], b['min']),
+        max=max(a['max'], b['max']),
+        histogram=a['histogram'] + b['histogram'],
+        underflow=a['underflow'] + b['underflow'],
+        overflow=a['overflow'] + b['overflow']
+    )
+
+
+def histogram_quantile(counts, edges, underflow, overflow, q):
+    """
+    Estimates a quantile from a histogram (linear interpolation within the bins).
+
+    :returns: estimated quantile, NaN if it falls outside the histogram
+    """
+    cumulative = underflow + np.concatenate([[0], np.cumsum(counts)])
+    target = q * (underflow + counts.sum() + overflow)
+    if target < cumulative[0] or target > cumulative[-1] or cumulative[-1] == cumulative[0]:
+        return np.nan
+    return np.interp(target, cumulative, edges)
+
+
+def propagate_uncertainty(m_object, m_counterweight, distance, height, y_origin=0, n_samples=10**6, chunk_size=10**6, bins=100, workers=None, seed=None):
+    """
+    Propagates the measurement uncertainties of the situation to the predicted angle and height with a Monte Carlo simulation.
+    Samples are evaluated in vectorized chunks across a pool of processes. Each chunk has its own random seed derived from the global one,
+    so that the results do not depend on the number of workers. Only summaries are kept in memory, not the samples themselves.
+
+    :m_object: mass of the suspended object, as a value or a pair (value, standard deviation)
+    :m_counterweight: mass of the counterweight, as a value or a pair (value, standard deviation)
+    :distance: horizontal distance between the two poles, as a value or a pair (value, standard deviation)
+    :height: height of the poles, as a value or a pair (value, standard deviation)
+    :y_origin: y coordinate of the ground
+    :n_samples: total number of samples
+    :chunk_size: number of samples evaluated at once by a worker
+    :bins: number of bins of the histograms
+    :workers: number of processes (by default, the number of CPUs)
+    :seed: seed of the simulation (None for a random one)
+
+    :returns: dict with, for each output ('angle' in degrees, 'height' in m): count, mean, std, min, max, 95% interval and histogram (counts, edges),
+              None if the parameters are invalid
+    """
+    parameters = (m_object, m_counterweight, distance, height, y_origin)
+
+    if n_samples < 1:
+        print("\033[1m\x1b[91m The number of samples must be at least 1. \x1b[0m\033[0m")
+        return None
+    for name, parameter in zip(['m_object', 'm_counterweight', 'distance', 'height'], parameters):
+        # the samples are truncated to positive values, around a positive measure
+        if np.ndim(parameter) > 0 and parameter[1] > 0 and parameter[0] <= 0:
+            print(f"\033[1m\x1b[91m The measure of {name} must be positive: {parameter[0]} given. \x1b[0m\033[0m")
+            return None
+    seed_sequence = np.random.SeedSequence(seed)
+    pilot_seed, chunks_seed = seed_sequence.spawn(2)
+
+    # A small pilot run fixes the range of the histograms, so that the chunks can be summarized independently
+    pilot = evaluate(*sample_inputs(np.random.default_rng(pilot_seed), min(n_samples, 10**5), *parameters[:4]), y_origin=y_origin)
+    edges = {}
+    for name, values in pilot.items():
+        values = values[np.isfinite(values)]
+        low, high = np.percentile(values, [0.01, 99.99]) if values.size else (0, 1)
+        margin = 0.1 * (high - low) or 0.5 * (abs(low) or 1)
+        edges[name] = np.linspace(low - margin, high + margin, bins + 1)
+
+    sizes = [chunk_size] * (n_samples // chunk_size) + ([n_samples % chunk_size] if n_samples % chunk_size else [])
+    tasks = [(chunk_seed, size, parameters, edges) for chunk_seed, size in zip(chunks_seed.spawn(len(sizes)), sizes)]
+
+    # Summaries are merged in the order of the chunks, so that the results are reproducible
+    summaries = None
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for chunk in executor.map(simulate_chunk, tasks):
+            summaries = chunk if summaries is None else {name: merge_summaries(summaries[name], chunk[name]) for name in OUTPUTS}
+
+    results = {}
+    for name in OUTPUTS:
+        s = summaries[name]
+        results[name] = dict(
+            count=s['count'],
+            mean=s['mean'],
+            std=np.sqrt(s['m2'] / (s['count'] - 1)) if s['count'] > 1 else np.nan,
+            min=s['min'],
+            max=s['max'],
+            interval_95=(histogram_quantile(s['histogram'], edges[name], s['underflow'], s['overflow'], 0.025),
+                         histogram_quantile(s['histogram'], edges[name], s['underflow'], s['overflow'], 0.975)),
+            histogram=(s['histogram'], edges[name])
+        )
+    return results
+
+
+# EOF
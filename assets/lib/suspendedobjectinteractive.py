@@ -3,6 +3,7 @@ from IPython import get_ipython
 get_ipython().run_line_magic('matplotlib', 'widget')
 
 import numpy as np
+from collections import OrderedDict
 
 from ipywidgets import interact, interactive, fixed, interact_manual
 from ipywidgets import HBox, VBox, Label, Layout
@@ -15,14 +16,238 @@ set_matplotlib_formats('svg')
 
 import matplotlib.pyplot as plt
 import matplotlib.patches as pat
+from matplotlib.collections import LineCollection
+from matplotlib.colors import to_rgba
+from matplotlib.artist import Artist
+from matplotlib.backends.backend_agg import RendererAgg
+from matplotlib.font_manager import FontProperties
+from matplotlib import cbook
+
+from .lablifecycle import LabLifecycle
 plt.style.use('seaborn-whitegrid') # global style for plotting
 
-class SuspendedObjectLab:
+
+class CachedLabel(Artist):
+    """
+    Label made of a static prefix and suffix (possibly mathtext) around a numeric value, drawn in a rounded box.
+    The prefix and the suffix are rasterized only once; each new value only rasterizes its digits, which are composited with them into an image of the whole label.
+    Images are kept for the last values displayed, so that drawing the label is a single image blit, and nothing is redrawn if the value and the position are unchanged.
+    """
+    zorder = 3
+
+    def __init__(self, ax, prefix, value, suffix, xy, xytext, fmt='{:.2f}', cache_size=256):
+        '''
+        Creates the label and adds it to the axes.
+
+        :ax: axes on which the label is drawn
+        :prefix: static text displayed before the value
+        :value: initial numeric value
+        :suffix: static text displayed after the value
+        :xy: point (in data coordinates) the label is attached to
+        :xytext: offset of the baseline of the label from the point, in points
+        :fmt: format used to display the value
+        :cache_size: number of values for which the rendered label is kept
+        '''
+        super().__init__()
+        self.prefix = prefix
+        self.suffix = suffix
+        self.fmt = fmt
+        self.value_text = fmt.format(value)
+        self.xy = tuple(xy)
+        self.xytext = xytext
+        self.cache_size = cache_size
+
+        self.prop = FontProperties() # default font and color, as for the other texts of the figure
+        self.color = np.asarray(to_rgba(plt.rcParams['text.color']))
+        self.tiles = {} # (text, dpi) -> (coverage, baseline, advance) of the static parts
+        self.images = OrderedDict() # (value text, dpi) -> (RGBA image, padding, depth below the baseline) of the whole label, least recently used first
+
+        ax.add_artist(self)
+
+
+    def update(self, value, xy=None):
+        """
+        Updates the value and (optionally) the position of the label.
+        The figure is not marked for redrawing if the formatted value and the position are unchanged.
+
+        :value: new numeric value
+        :xy: new point (in data coordinates) the label is attached to
+        """
+        value_text = self.fmt.format(value)
+        if value_text != self.value_text:
+            self.value_text = value_text
+            self.stale = True
+
+        if xy is not None and tuple(xy) != self.xy:
+            self.xy = tuple(xy)
+            self.stale = True
+
+
+    def render_text(self, text, dpi):
+        """
+        Rasterizes a text with the font of the label.
+
+        :returns: coverage of the pixels (from 0 to 1, top row first, one pixel of margin on the left), row of the baseline and advance of the text in pixels
+        """
+        ismath = cbook.is_math_text(text)
+        width = RendererAgg(1, 1, dpi).get_text_width_height_descent(text, self.prop, ismath=ismath)[0]
+
+        # drawn in a canvas large enough for any glyph (e.g. superscripts), then cropped to the rows actually covered
+        size = self.prop.get_size_in_points() * dpi / 72
+        baseline = int(np.ceil(2 * size))
+        renderer = RendererAgg(int(np.ceil(width)) + 2, int(np.ceil(3 * size)), dpi)
+        gc = renderer.new_gc()
+        gc.set_foreground('black')
+        renderer.draw_text(gc, 1, baseline, text, self.prop, 0, ismath=ismath) # position of the baseline from the top of the canvas
+        gc.restore()
+
+        coverage = np.asarray(renderer.buffer_rgba())[..., 3] / 255
+        rows = np.flatnonzero(coverage.max(axis=1))
+        top, bottom = (rows[0], rows[-1] + 1) if rows.size else (baseline - 1, baseline)
+        return coverage[top:bottom], baseline - top, width
+
+
+    def get_image(self, dpi):
+        """
+        Returns the image of the label for the current value, rendering it if it is not in the cache.
+
+        :returns: RGBA image (bottom row first, as expected by the renderers), padding around the text and depth of the image below the baseline, in pixels
+        """
+        key = (self.value_text, dpi)
+        if key in self.images:
+            self.images.move_to_end(key)
+            return self.images[key]
+
+        # the static parts are rasterized once per resolution
+        for text in (self.prefix, self.suffix):
+            if (text, dpi) not in self.tiles:
+                self.tiles[(text, dpi)] = self.render_text(text, dpi)
+        parts = [self.tiles[(self.prefix, dpi)], self.render_text(self.value_text, dpi), self.tiles[(self.suffix, dpi)]]
+
+        # the parts are separated by a space and aligned on their baseline, in a box padded like boxstyle 'round'
+        measure = RendererAgg(1, 1, dpi).get_text_width_height_descent
+        gap = measure('x x', self.prop, ismath=False)[0] - measure('xx', self.prop, ismath=False)[0]
+        pad = int(round(self.prop.get_size_in_points() * dpi / 72 * 0.3))
+        above = max(baseline for coverage, baseline, advance in parts)
+        below = max(coverage.shape[0] - baseline for coverage, baseline, advance in parts)
+        width = int(np.ceil(sum(advance for coverage, baseline, advance in parts) + 2 * gap)) + 2 * pad
+        height = above + below + 2 * pad
+
+        text_alpha = np.zeros((height, width + 2))
+        x = pad
+        for coverage, baseline, advance in parts:
+            top, left = pad + above - baseline, int(round(x)) - 1
+            area = text_alpha[top:top + coverage.shape[0], left:left + coverage.shape[1]]
+            area[...] = np.maximum(area, coverage[:, :area.shape[1]])
+            x += advance + gap
+        text_alpha = text_alpha[:, :width]
+
+        # rounded box (white, alpha 0.8) under the text
+        rows, cols = np.ogrid[:height, :width]
+        dx = np.maximum(np.maximum(pad - cols, cols - (width - 1 - pad)), 0)
+        dy = np.maximum(np.maximum(pad - rows, rows - (height - 1 - pad)), 0)
+        box_alpha = 0.8 * (dx**2 + dy**2 <= pad**2)
+
+        alpha = text_alpha + (1 - text_alpha) * box_alpha
+        with np.errstate(invalid='ignore', divide='ignore'):
+            rgb = (text_alpha[..., None] * self.color[:3] + ((1 - text_alpha) * box_alpha)[..., None]) / alpha[..., None]
+        image = np.empty((height, width, 4), dtype=np.uint8)
+        image[..., :3] = np.round(255 * np.where(alpha[..., None] > 0, rgb, 1))
+        image[..., 3] = np.round(255 * alpha)
+
+        self.images[key] = (image[::-1].copy(), pad, below + pad)
+        if len(self.images) > self.cache_size:
+            self.images.popitem(last=False)
+        return self.images[key]
+
+
+    def draw(self, renderer):
+        if not self.get_visible():
+            return
+        image, pad, depth = self.get_image(renderer.dpi)
+
+        x, y = self.axes.transData.transform(self.xy)
+        x += renderer.points_to_pixels(self.xytext[0]) - pad
+        y += renderer.points_to_pixels(self.xytext[1]) - depth
+
+        gc = renderer.new_gc()
+        renderer.draw_image(gc, int(round(x)), int(round(y)), image)
+        gc.restore()
+        self.stale = False
+
+
+class HistoryTrail:
+    """
+    Fading trace of the previous positions of the object and of the force vectors applied to it.
+    The last states are kept in preallocated arrays used as a ring buffer, so that the cost of each update does not depend on the length of the session.
+    """
+
+    def __init__(self, ax, length, point, forces, colors, max_alpha=0.4):
+        '''
+        Creates the (invisible) trail and adds it to the axes.
+
+        :ax: axes on which the trail is drawn
+        :length: maximum number of states kept in the trail
+        :point: initial position of the object
+        :forces: initial force vectors applied to the object, as a list of (x, y)
+        :colors: color of each force vector
+        :max_alpha: opacity of the most recent state (older states fade out linearly)
+        '''
+        self.length = length
+        self.forces_nb = len(forces)
+        self.count = 0
+
+        # preallocated buffers: one point and forces_nb segments per state
+        self.points = np.tile(np.asarray(point, dtype=float), (length, 1))
+        self.segments = np.tile(np.asarray(point, dtype=float), (length*self.forces_nb, 2, 1))
+        self.point_colors = np.tile(to_rgba('black'), (length, 1))
+        self.segment_colors = np.tile([to_rgba(c) for c in colors], (length, 1))
+        self.point_colors[:, 3] = 0
+        self.segment_colors[:, 3] = 0
+
+        # opacity of a state depending on its age (0 for the most recent one)
+        self.fade = max_alpha * np.arange(length, 0, -1) / length
+
+        self.scatter = ax.scatter(self.points[:, 0], self.points[:, 1], s=40, c=self.point_colors, edgecolors='none', zorder=10)
+        self.lines = LineCollection(self.segments, colors=self.segment_colors, linewidths=1, zorder=9)
+        ax.add_collection(self.lines, autolim=False)
+
+
+    def push(self, point, forces):
+        """
+        Appends a state to the trail, replacing the oldest one if the trail is full.
+
+        :point: position of the object
+        :forces: force vectors applied to the object, as a list of (x, y)
+        """
+        slot = self.count % self.length
+        point = np.asarray(point, dtype=float)
+        self.points[slot] = point
+        self.segments[slot*self.forces_nb:(slot+1)*self.forces_nb, 0] = point
+        self.segments[slot*self.forces_nb:(slot+1)*self.forces_nb, 1] = point + np.asarray(forces, dtype=float)
+        self.count += 1
+
+        # update the opacity of all states according to their age
+        slots = np.arange(self.length)
+        alpha = np.where(slots < self.count, self.fade[(self.count - 1 - slots) % self.length], 0)
+        self.point_colors[:, 3] = alpha
+        self.segment_colors[:, 3] = np.repeat(alpha, self.forces_nb)
+
+        self.scatter.set_offsets(self.points)
+        self.scatter.set_facecolors(self.point_colors)
+        self.lines.set_segments(self.segments)
+        self.lines.set_colors(self.segment_colors)
+
+
+
+class SuspendedObjectLab(LabLifecycle):
     """
     This class embeds all the necessary code to create a virtual lab to study the static equilibrium of an object suspended on a clothesline with a counterweight.
+    The lab stays alive (with its interface working) until it is closed with close() or at the end of a with statement, which also closes its figure,
+    or replaced by a new lab displayed by the same cell when it is executed again.
     """
     
-    def __init__(self, m_object = 3, distance = 2, height = 1, x_origin = 0, y_origin = 0):
+    def __init__(self, m_object = 3, distance = 2, height = 1, x_origin = 0, y_origin = 0, history_length = 0):
         '''
         Initiates and displays the virtual lab on suspended objects.
         
@@ -31,7 +256,9 @@ class SuspendedObjectLab:
         :height: height of the poles (same height for both)
         :x_origin: x coordinate of the bottom of the left pole (origin of the coordinate system)
         :y_origin: y coordinate of the bottom of the left pole (origin of the coordinate system)
+        :history_length: number of previous states of the object shown as a fading trail (0 to disable)
         '''
+        super().__init__()
         
 		###--- Static parameters of the situation
         self.m_object = m_object # mass of the wet object, in kg
@@ -42,6 +269,8 @@ class SuspendedObjectLab:
         self.x_origin = x_origin # x coordinate of point of origin of the figure = x position of the left pole, in m
         self.y_origin = y_origin # y coordinate of point of origin of the figure = y position of the lower point (ground), in m
 
+        self.history_length = history_length # number of previous states shown in the trail
+
 
         
         ###--- Then we define the elements of the ihm:
@@ -59,24 +288,31 @@ class SuspendedObjectLab:
         self.quiz_output = widgets.Output()
 
         # Linking widgets to handlers
-        self.m_counterweight_widget.observe(self.m_counterweight_event_handler, names='value')
+        self.observe(self.m_counterweight_widget, self.m_counterweight_event_handler, 'value')
+        self.own(self.m_counterweight_label, self.m_counterweight_widget, self.m_counterweight_input, self.quiz_output)
 
 
         
         ###--- Compute variables dependent with the counterweight selected by the user
         alpha = self.get_angle(self.m_counterweight)
         alpha_degrees = alpha*180/np.pi
-        alpha_text = r'$\alpha$ = {:.2f} $^\circ$'.format(alpha_degrees)
         
         coord_object = self.get_object_coords(alpha)
-        height_text =  r'h = {:.2f} $m$'.format(coord_object[1])
 
 
         
         ###--- Create the figure
         
         # Create the figure and subplots in it
-        self.fig = plt.figure(num='Suspended Object Lab', constrained_layout=False, figsize=(10,4)) # hack for interactive backend: num is the title which appears above the canvas
+        # each lab owns its figure: an existing figure with the same title would be reused by pyplot
+        num = 'Suspended Object Lab'
+        n = 1
+        while plt.fignum_exists(num):
+            n += 1
+            num = 'Suspended Object Lab ({})'.format(n)
+        self.fig = plt.figure(num=num, constrained_layout=False, figsize=(10,4)) # hack for interactive backend: num is the title which appears above the canvas
+
+        self.on_close(plt.close, self.fig)
         gs = self.fig.add_gridspec(ncols=7, nrows=1, wspace=0.5, hspace=0, right=0.95, top=0.9, left=0.05, bottom=0.1)
         ax1 = self.fig.add_subplot(gs[0, :3])
         ax2 = self.fig.add_subplot(gs[0, 3:5], sharey = ax1)
@@ -135,11 +371,11 @@ class SuspendedObjectLab:
         fig_ratio = self.height / self.distance
         self.cable_angle = pat.Arc(xy = (self.x_origin, self.y_origin+self.height), width = ellipse_radius/fig_ratio, height = ellipse_radius, theta1 = -1*alpha_degrees, theta2 = 0, color="gray", linestyle='-.')
         ax1.add_patch(self.cable_angle)
-        self.cable_angle_text = ax1.annotate(alpha_text, xy=(self.x_origin, self.y_origin+self.height), xytext=(30, -15), textcoords='offset points', bbox=dict(boxstyle="round", facecolor = "white", edgecolor = "white", alpha = 0.8))
+        self.cable_angle_text = CachedLabel(ax1, r'$\alpha$ =', alpha_degrees, r'$^\circ$', xy=(self.x_origin, self.y_origin+self.height), xytext=(30, -15))
         
         # -DYN- Draw the point at which the object is suspended
         self.cable_point = ax1.scatter(coord_object[0], coord_object[1], s=80, c="black", zorder=15)
-        self.cable_point_text = ax1.annotate(height_text, xy=(coord_object[0], coord_object[1]), xytext=(10, -10), textcoords='offset points', bbox=dict(boxstyle="round", facecolor = "white", edgecolor = "white", alpha = 0.8))
+        self.cable_point_text = CachedLabel(ax1, 'h =', coord_object[1], r'$m$', xy=(coord_object[0], coord_object[1]), xytext=(10, -10))
         
         # -DYN- Draw the force vectors
         # Parameters for drawing forces
@@ -160,6 +396,12 @@ class SuspendedObjectLab:
         self.cable_tension_left_text = ax1.annotate(r'$\vec{T}$', xy=(coord_object[0], coord_object[1]), xytext=(-45, 5), textcoords='offset points', color='red')
         self.cable_tension_sum = ax1.quiver(coord_object[0], coord_object[1], 0, Fy, color='red', angles='xy', scale_units='xy', scale=1, zorder=12, width=0.007, facecolor="none", edgecolor="red", hatch="/"*8, linewidth=0.0)
         self.cable_tension_sum_text = ax1.annotate(r'$\vec{T_r}$', xy=(coord_object[0], coord_object[1]), xytext=(10, 45), textcoords='offset points', color='red')
+
+        # -DYN- Draw the trail of the previous positions of the object and forces
+        self.history = None
+        if self.history_length > 0:
+            self.history = HistoryTrail(ax1, self.history_length, coord_object, [(0, -Fy), (Tx, Ty), (-Tx, Ty)], ['blue', 'red', 'red'])
+            self.history.push(coord_object, [(0, -Fy), (Tx, Ty), (-Tx, Ty)])
         
         
         ###--- Then display the angle and the height as functions from the mass of the counterweight
@@ -192,16 +434,17 @@ class SuspendedObjectLab:
         
         # -DYN- Add the current height from the counterweight selected by the user
         self.graph_height_point = ax2.scatter(self.m_counterweight, coord_object[1], s=80, c="black", zorder=15)
-        self.graph_height_text = ax2.annotate(height_text, xy=(self.m_counterweight, coord_object[1]), xytext=(10, -10), textcoords='offset points', bbox=dict(boxstyle="round", facecolor = "white", edgecolor = "white", alpha = 0.8))
+        self.graph_height_text = CachedLabel(ax2, 'h =', coord_object[1], r'$m$', xy=(self.m_counterweight, coord_object[1]), xytext=(10, -10))
 
         # -DYN- Add the current angle from the counterweight selected by the user
         self.graph_angle_point = ax3.scatter(self.m_counterweight, alpha_degrees, s=80, c="black", zorder=15)
-        self.graph_angle_text = ax3.annotate(alpha_text, xy=(self.m_counterweight, alpha_degrees), xytext=(10, 5), textcoords='offset points', bbox=dict(boxstyle="round", facecolor = "white", edgecolor = "white", alpha = 0.8))
+        self.graph_angle_text = CachedLabel(ax3, r'$\alpha$ =', alpha_degrees, r'$^\circ$', xy=(self.m_counterweight, alpha_degrees), xytext=(10, 5))
 
 
 
         ###--- Display the whole interface
         display(self.m_counterweight_input)
+        self.keep_open()
         
 
 
@@ -271,10 +514,8 @@ class SuspendedObjectLab:
         # Compute new values with the counterweight selected by the user
         alpha = self.get_angle(self.m_counterweight)
         alpha_degrees = alpha*180/np.pi
-        alpha_text = r'$\alpha$ = {:.2f} $^\circ$'.format(alpha_degrees)
         
         coord_object = self.get_object_coords(alpha)
-        height_text =  r'h = {:.2f} $m$'.format(coord_object[1])
         
         ### Update the clothesline figure
         # Update of the cable line
@@ -285,12 +526,11 @@ class SuspendedObjectLab:
         
         # Update of the point
         self.cable_point.set_offsets(coord_object)
-        self.cable_point_text.set_text(height_text)
-        self.cable_point_text.xy = (coord_object[0], coord_object[1])
+        self.cable_point_text.update(coord_object[1], xy=(coord_object[0], coord_object[1]))
         
         # Update of the angle
         self.cable_angle.theta1 = -1*alpha_degrees
-        self.cable_angle_text.set_text(alpha_text)
+        self.cable_angle_text.update(alpha_degrees)
         
         # Update the weight position (direction does not change)
         self.cable_weight.set_offsets(coord_object)
@@ -308,17 +548,20 @@ class SuspendedObjectLab:
         self.cable_tension_sum.set_offsets(coord_object)
         self.cable_tension_sum_text.xy = (coord_object[0], coord_object[1])
         
+        # Add the new state to the trail
+        if self.history is not None:
+            Fy = self.m_object*self.gravity*self.force_scaling
+            self.history.push(coord_object, [(0, -Fy), (Tx, Ty), (-Tx, Ty)])
+        
         
         ### Update the other two graphs
         # Update point of angle
         self.graph_angle_point.set_offsets([self.m_counterweight, alpha_degrees])
-        self.graph_angle_text.set_text(alpha_text)
-        self.graph_angle_text.xy = (self.m_counterweight, alpha_degrees)
+        self.graph_angle_text.update(alpha_degrees, xy=(self.m_counterweight, alpha_degrees))
 
         # Update point of height
         self.graph_height_point.set_offsets([self.m_counterweight, coord_object[1]])
-        self.graph_height_text.set_text(height_text)
-        self.graph_height_text.xy = (self.m_counterweight, coord_object[1])
+        self.graph_height_text.update(coord_object[1], xy=(self.m_counterweight, coord_object[1]))
         
         
         # Display graph 
@@ -0,0 +1,142 @@
+import numpy as np
+from collections import namedtuple
+
+
+# Result of an inverse problem:
+# - value: solution for each target (NaN where the target cannot be reached)
+# - reachable: True where the solution is valid
+# - on_ground: True where the target corresponds to the object resting on the ground (no unique solution)
+# - out_of_domain: True where the target is outside the physical domain (e.g. arcsin argument outside [-1;1], object above the poles)
+InverseSolution = namedtuple('InverseSolution', ['value', 'reachable', 'on_ground', 'out_of_domain'])
+
+
+# Forward problem (vectorized versions of SuspendedObjectLab.get_angle and SuspendedObjectLab.get_object_coords)
+def get_angles(m_counterweight, m_object, distance, height):
+    """
+    Computes the angle that the cable makes with the horizon for each counterweight:
+    - if the counterweight is sufficient: angle = arcsin(1/2 * m_object / m_counterweight)
+    - else (object on the ground): alpha = arctan(height / (distance / 2))
+    All parameters are broadcast against each other.
+
+    :m_counterweight: mass(es) of the counterweight
+    :m_object: mass(es) of the suspended object
+    :distance: horizontal distance(s) between the two poles
+    :height: height(s) of the poles
+
+    :returns: angles that the cable makes with the horizon (in rad)
+    """
+    m_counterweight, m_object, distance, height = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (m_counterweight, m_object, distance, height)))
+
+    # Default alpha value i.e. object is on the ground
+    alpha_default = np.arctan(height / (distance / 2))
+
+    # The ratio of masses is only meaningful with an actual counterweight, and arcsin is only defined on [-1;1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = 0.5 * m_object / m_counterweight
+    valid = (m_counterweight > 0) & (np.abs(ratio) < 1)
+    alpha = np.where(valid, np.arcsin(np.where(valid, ratio, 0)), alpha_default)
+
+    return np.minimum(alpha_default, alpha)
+
+
+def get_object_heights(angle, distance, height, y_origin=0):
+    """
+    Computes the height at which the object hangs for each angle (object midway between the poles).
+    The object is considered on the ground for all angles giving a delta height higher than the height of the poles.
+    All parameters are broadcast against each other.
+
+    :angle: angle(s) that the cable makes with the horizon, in radians
+    :distance: horizontal distance(s) between the two poles
+    :height: height(s) of the poles
+    :y_origin: y coordinate of the ground
+
+    :returns: y coordinates of the point at which the object is hanged
+    """
+    angle, distance, height, y_origin = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (angle, distance, height, y_origin)))
+
+    # the angle must be comprised between horizontal (greater than 0) and vertical (smaller than pi/2)
+    valid = (angle > 0) & (angle < np.pi / 2)
+    delta = 0.5 * distance * np.tan(np.where(valid, angle, 0))
+
+    # the delta must be smaller than the height of the poles (otherwise the object is on the ground)
+    hanging = valid & (delta <= height)
+    return np.where(hanging, y_origin + height - delta, y_origin)
+
+
+# Inverse problems (closed forms)
+def solve_angle_for_height(target_height, distance, height, y_origin=0):
+    """
+    Computes the angle that the cable must make with the horizon so that the object hangs at the target height:
+    alpha = arctan((height - h) / (distance / 2))
+    All parameters are broadcast against each other.
+
+    :target_height: y coordinate(s) at which the object should hang
+    :distance: horizontal distance(s) between the two poles
+    :height: height(s) of the poles
+    :y_origin: y coordinate of the ground
+
+    :returns: InverseSolution with the angles (in rad)
+    """
+    target_height, distance, height, y_origin = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (target_height, distance, height, y_origin)))
+
+    delta = y_origin + height - target_height
+
+    # on the ground, every angle above the default one gives the same height
+    on_ground = target_height <= y_origin
+    # at (or above) the horizon, the cable would have to be horizontal (infinite counterweight), NaN targets have no solution
+    out_of_domain = ~on_ground & ((delta <= 0) | ~np.isfinite(delta))
+    reachable = ~on_ground & ~out_of_domain
+
+    alpha = np.where(reachable, np.arctan(delta / (distance / 2)), np.nan)
+    return InverseSolution(alpha, reachable, on_ground, out_of_domain)
+
+
+def solve_counterweight_for_angle(target_angle, m_object, distance, height):
+    """
+    Computes the counterweight needed for the cable to make the target angle with the horizon:
+    m_counterweight = m_object / (2 * sin(alpha))
+    All parameters are broadcast against each other.
+
+    :target_angle: angle(s) that the cable should make with the horizon, in radians
+    :m_object: mass(es) of the suspended object
+    :distance: horizontal distance(s) between the two poles
+    :height: height(s) of the poles
+
+    :returns: InverseSolution with the masses of the counterweight
+    """
+    target_angle, m_object, distance, height = np.broadcast_arrays(*(np.asarray(a, dtype=float) for a in (target_angle, m_object, distance, height)))
+
+    alpha_default = np.arctan(height / (distance / 2))
+
+    # the default angle (and above) means the object rests on the ground, for any light enough counterweight
+    on_ground = target_angle >= alpha_default
+    # the cable cannot be horizontal or pointing upwards, NaN targets have no solution
+    out_of_domain = ~on_ground & ((target_angle <= 0) | ~np.isfinite(target_angle))
+    reachable = ~on_ground & ~out_of_domain
+
+    with np.errstate(divide='ignore'):
+        m_counterweight = np.where(reachable, m_object / (2 * np.sin(target_angle)), np.nan)
+    return InverseSolution(m_counterweight, reachable, on_ground, out_of_domain)
+
+
+def solve_counterweight_for_height(target_height, m_object, distance, height, y_origin=0):
+    """
+    Computes the counterweight needed for the object to hang at the target height.
+    All parameters are broadcast against each other.
+
+    :target_height: y coordinate(s) at which the object should hang
+    :m_object: mass(es) of the suspended object
+    :distance: horizontal distance(s) between the two poles
+    :height: height(s) of the poles
+    :y_origin: y coordinate of the ground
+
+    :returns: InverseSolution with the masses of the counterweight
+    """
+    angle = solve_angle_for_height(target_height, distance, height, y_origin)
+    mass = solve_counterweight_for_angle(np.where(angle.reachable, angle.value, 0), m_object, distance, height)
+
+    reachable = angle.reachable & mass.reachable
+    return InverseSolution(np.where(reachable, mass.value, np.nan), reachable, angle.on_ground, angle.out_of_domain | (angle.reachable & ~mass.reachable))
+
+
+# EOF
@@ -0,0 +1,225 @@
+import os
+import json
+import time
+import queue
+import threading
+
+import nbformat
+from nbclient import NotebookClient
+from nbclient.exceptions import CellExecutionError, CellTimeoutError, DeadKernelError
+from nbclient.util import run_sync
+from jupyter_client import AsyncKernelManager
+
+
+# Code run once when a kernel starts, so that the heavy imports are paid only once per kernel
+WARMUP_CODE = """\
+import numpy
+import matplotlib.pyplot
+import bokeh.plotting
+import ipywidgets
+"""
+
+# Code run before each worksheet (and removed from the output): it clears the namespace and forgets the modules of the
+# project itself, so that they are executed again (e.g. output_notebook() of the labs), while third-party modules stay warm
+RESET_CODE = """\
+%reset -f
+import sys as _sys, os as _os
+for _name, _module in list(_sys.modules.items()):
+    if (getattr(_module, '__file__', None) or '').startswith({root!r} + _os.sep):
+        del _sys.modules[_name]
+if 'matplotlib.pyplot' in _sys.modules:
+    _sys.modules['matplotlib.pyplot'].close('all')
+del _sys, _os
+"""
+
+
+def parameterize_notebook(nb, parameters):
+    """
+    Returns a copy of the notebook in which the given parameters are defined.
+    As with papermill, a cell tagged 'injected-parameters' is inserted right after the cell tagged 'parameters' (or at the top if there is none).
+
+    :nb: notebook (nbformat.NotebookNode) to parameterize
+    :parameters: dict of the variables to define, e.g. {'m_object': 4, 'height': 1.2, 'distance': 6}
+
+    :returns: the parameterized notebook
+    """
+    nb = nbformat.from_dict(json.loads(json.dumps(nb)))
+
+    source = '# Injected parameters\n' + '\n'.join('{} = {!r}'.format(name, value) for name, value in parameters.items())
+    cell = nbformat.v4.new_code_cell(source=source, metadata={'tags': ['injected-parameters']})
+    cell.pop('id', None)
+
+    position = 0
+    for i, c in enumerate(nb.cells):
+        if 'parameters' in c.get('metadata', {}).get('tags', []):
+            position = i + 1
+            break
+    nb.cells.insert(position, cell)
+
+    return nb
+
+
+class Worker(threading.Thread):
+    """
+    Thread owning one local kernel, kept warm between the worksheets it executes.
+    """
+
+    def __init__(self, jobs, template, cwd, timeout, kernel_name, on_result):
+        '''
+        :jobs: queue of (name, parameters, output path) to execute, None to stop
+        :template: notebook to parameterize
+        :cwd: directory in which the worksheets are executed
+        :timeout: maximum duration of a cell, in seconds
+        :kernel_name: name of the kernel to use
+        :on_result: function called with the result of each worksheet
+        '''
+        super().__init__(daemon=True)
+        self.jobs = jobs
+        self.template = template
+        self.cwd = cwd
+        self.timeout = timeout
+        self.kernel_name = kernel_name
+        self.on_result = on_result
+        self.km = None
+
+
+    def run(self):
+        try:
+            while True:
+                job = self.jobs.get()
+                if job is None:
+                    return
+                self.on_result(self.execute(*job))
+        finally:
+            self.shutdown_kernel()
+
+
+    def start_kernel(self):
+        # Starts the kernel and pays the heavy imports once (the kernel manager starts the kernel on the first execution)
+        self.km = AsyncKernelManager(kernel_name=self.kernel_name)
+        self.execute_cells(nbformat.v4.new_notebook(cells=[nbformat.v4.new_code_cell(WARMUP_CODE)]))
+
+
+    def shutdown_kernel(self):
+        # The next worksheet will start (and warm up) a new kernel
+        km, self.km = self.km, None
+        if km is None:
+            return
+        try:
+            if run_sync(km.is_alive)():
+                run_sync(km.shutdown_kernel)(now=True)
+        except Exception:
+            pass
+
+
+    def execute_cells(self, nb):
+        client = NotebookClient(nb, km=self.km, kernel_name=self.kernel_name, timeout=self.timeout, resources={'metadata': {'path': self.cwd}})
+        try:
+            client.execute(cleanup_kc=False)
+        finally:
+            if client.kc is not None:
+                client.kc.stop_channels()
+
+
+    def execute(self, name, parameters, path):
+        status, error = 'ok', None
+        startup_seconds = 0.
+
+        nb = parameterize_notebook(self.template, parameters)
+        nb.cells.insert(0, nbformat.v4.new_code_cell(RESET_CODE.format(root=self.cwd)))
+
+        # Whatever happens, the worksheet is written and reported: a failed kernel is replaced for the next worksheets
+        start = time.perf_counter()
+        try:
+            if self.km is None:
+                try:
+                    self.start_kernel()
+                finally:
+                    startup_seconds = time.perf_counter() - start
+                    start = time.perf_counter()
+
+            try:
+                self.execute_cells(nb)
+            except CellExecutionError as e:
+                # the message of the exception starts with the source of the cell, the error itself is in ename and evalue
+                status, error = 'error', '{}: {}'.format(e.ename, e.evalue)
+            except CellTimeoutError as e:
+                # the kernel is still busy with the cell which timed out
+                status, error = 'timeout', str(e).splitlines()[0] if str(e) else type(e).__name__
+                self.shutdown_kernel()
+            except DeadKernelError as e:
+                status, error = 'dead kernel', str(e)
+                self.shutdown_kernel()
+        except Exception as e:
+            status, error = 'error', '{}: {}'.format(type(e).__name__, e)
+            self.shutdown_kernel()
+        seconds = time.perf_counter() - start
+        nb.cells.pop(0)
+
+        # number the cells as if the worksheet had been executed in a fresh kernel
+        count = 0
+        for cell in nb.cells:
+            if cell.cell_type == 'code' and cell.get('execution_count') is not None:
+                count += 1
+                cell.execution_count = count
+                for output in cell.outputs:
+                    if 'execution_count' in output:
+                        output.execution_count = count
+
+        # outputs are written as soon as each worksheet is done
+        nbformat.write(nb, path)
+
+        return dict(name=name, path=path, status=status, error=error, seconds=seconds, startup_seconds=startup_seconds)
+
+
+def execute_worksheets(template_path, scenarios, output_dir, max_kernels=4, timeout=600, kernel_name='python3', log_path=None, verbose=True):
+    """
+    Generates and executes a personalised copy of a worksheet for each scenario, on a pool of local kernels.
+    Each kernel is started once and reused for several worksheets, so that imports are not paid again for each copy.
+    Everything runs locally: no network access is needed.
+
+    :template_path: path of the worksheet to copy (e.g. 'jupyterExample.ipynb'), with a cell tagged 'parameters'
+    :scenarios: dict mapping the name of each copy to its parameters, e.g. {'alice': {'m_object': 4, 'height': 1.2, 'distance': 6}}
+    :output_dir: directory where the executed copies are written (as <name>.ipynb)
+    :max_kernels: maximum number of kernels running at the same time
+    :timeout: maximum duration of a cell, in seconds
+    :kernel_name: name of the kernel to use
+    :log_path: path of a file in which the timing of each copy is appended (one JSON object per line), if any
+    :verbose: whether to print the timing of each copy
+
+    :returns: list of dicts (name, path, status, error, seconds, startup_seconds), in the order in which the copies were completed.
+              status is 'ok', 'error', 'timeout' or 'dead kernel'; seconds is the execution of the copy alone, and startup_seconds
+              the start and warm-up of a kernel before it (0 when a warm kernel was reused)
+    """
+    template = nbformat.read(template_path, as_version=4)
+    cwd = os.path.dirname(os.path.abspath(template_path))
+    os.makedirs(output_dir, exist_ok=True)
+
+    jobs = queue.Queue()
+    for name, parameters in scenarios.items():
+        jobs.put((name, parameters, os.path.join(output_dir, '{}.ipynb'.format(name))))
+
+    results = []
+    lock = threading.Lock()
+
+    def on_result(result):
+        with lock:
+            results.append(result)
+            if log_path is not None:
+                with open(log_path, 'a') as log:
+                    log.write(json.dumps(result) + '\n')
+            if verbose:
+                startup = ' (+{:.1f} s kernel startup)'.format(result['startup_seconds']) if result['startup_seconds'] else ''
+                print('[{}/{}] {} ({}) in {:.1f} s{}'.format(len(results), len(scenarios), result['name'], result['status'], result['seconds'], startup))
+
+    workers = [Worker(jobs, template, cwd, timeout, kernel_name, on_result) for _ in range(max(1, min(max_kernels, len(scenarios))))]
+    for worker in workers:
+        jobs.put(None)
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    return results
+
+
+# EOF
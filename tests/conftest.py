@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# the labs are imported as assets.lib.<module>, from the root of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def pytest_addoption(parser):
+    parser.addoption('--runslow', action='store_true', default=False, help='also run the slow tests (e.g. building 1000 labs)')
+
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'slow: long running test, only run with --runslow')
+
+
+def pytest_collection_modifyitems(config, items):
+    if config.getoption('--runslow'):
+        return
+    skip = pytest.mark.skip(reason='slow test, run with --runslow')
+    for item in items:
+        if 'slow' in item.keywords:
+            item.add_marker(skip)
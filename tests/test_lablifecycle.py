@@ -0,0 +1,151 @@
+import contextlib
+import gc
+import io
+import importlib
+import itertools
+
+import pytest
+import matplotlib.pyplot as plt
+import IPython
+
+from assets.lib import lablifecycle
+from assets.lib.lablifecycle import measure_rss_growth, open_labs
+
+
+# RSS growth tolerated per lab built and closed
+LIMIT_PER_LAB = 10 * 2**10 # bytes
+
+
+def rss_growth(build, n):
+    # a leak grows in every batch of labs, while one-off allocations (e.g. a cache or a pool of the allocator reaching a new size) only show in one of them
+    return min(measure_rss_growth(build, n=n), measure_rss_growth(build, n=n, warmup=0))
+
+
+def displayed_labs():
+    return [lab for execution, labs in open_labs.values() for lab in labs]
+
+
+@pytest.fixture(autouse=True)
+def close_labs():
+    yield
+    for lab in displayed_labs():
+        lab.close()
+
+
+class Shell:
+    # stands for IPython when the matplotlib lab is imported outside a notebook (the %matplotlib magic is ignored)
+    def run_line_magic(self, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def bokeh_lab():
+    module = importlib.import_module('assets.lib.suspendedobject')
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.setattr(module, 'display', lambda *args, **kwargs: None)
+        yield module.SuspendedObjectLab
+
+
+@pytest.fixture(scope='module')
+def matplotlib_lab():
+    backend = plt.get_backend()
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # headless figures: the backend is chosen before the module asks IPython for the widget backend
+        plt.switch_backend('Agg')
+        with monkeypatch.context() as importing:
+            importing.setattr(IPython, 'get_ipython', Shell)
+            module = importlib.import_module('assets.lib.suspendedobjectinteractive')
+        monkeypatch.setattr(module, 'display', lambda *args, **kwargs: None)
+        yield module.SuspendedObjectLab
+    plt.switch_backend(backend)
+
+
+@pytest.fixture
+def silent():
+    # show() of Bokeh prints its output outside a notebook
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def build_bokeh(lab_class):
+    def build():
+        with lab_class() as lab:
+            lab.launch()
+    return build
+
+
+def build_matplotlib(lab_class):
+    def build():
+        with lab_class() as lab:
+            pass
+    return build
+
+
+def drop_bokeh(lab_class):
+    def build():
+        lab_class().launch()
+    return build
+
+
+def drop_matplotlib(lab_class):
+    def build():
+        lab_class()
+    return build
+
+
+@pytest.mark.parametrize('n', [100, pytest.param(1000, marks=pytest.mark.slow)])
+@pytest.mark.parametrize('lab_name, builder', [('bokeh_lab', build_bokeh), ('matplotlib_lab', build_matplotlib)])
+def test_closed_labs_release_memory(request, silent, lab_name, builder, n):
+    growth = rss_growth(builder(request.getfixturevalue(lab_name)), n)
+    assert growth < n * LIMIT_PER_LAB
+
+
+@pytest.mark.parametrize('lab_name, builder', [('bokeh_lab', drop_bokeh), ('matplotlib_lab', drop_matplotlib)])
+def test_discarded_labs_are_replaced(request, monkeypatch, silent, lab_name, builder):
+    # labs displayed and dropped without close(), as when a notebook cell creating a lab is executed again (by a frontend which does not send the id of the cell)
+    executions = itertools.count(1)
+    monkeypatch.setattr(lablifecycle, 'current_execution', lambda: (None, next(executions)))
+    n = 100
+    growth = rss_growth(builder(request.getfixturevalue(lab_name)), n)
+    assert growth < n * LIMIT_PER_LAB
+    assert len(displayed_labs()) == 1
+    assert len(plt.get_fignums()) <= 1
+
+
+def test_executing_a_cell_again_replaces_its_labs(monkeypatch, silent, bokeh_lab):
+    def display_in(cell, execution):
+        monkeypatch.setattr(lablifecycle, 'current_execution', lambda: (cell, execution))
+        lab = bokeh_lab()
+        lab.launch()
+        return lab
+
+    first, other = display_in('cell-1', 1), display_in('cell-2', 2)
+    # labs displayed by the same execution of a cell coexist
+    second, third = display_in('cell-1', 3), display_in('cell-1', 3)
+
+    assert set(displayed_labs()) == {other, second, third}
+    assert first.alpha_slider_widget.comm is None
+    assert other.alpha_slider_widget.comm is not None
+
+
+def test_displayed_lab_stays_open_until_closed(silent, bokeh_lab):
+    bokeh_lab().launch()
+    gc.collect()
+    lab, = displayed_labs()
+
+    # the handler still reaches the lab, although the notebook keeps no reference to it
+    lab.alpha_slider_widget.value = 10
+    assert lab.object_source.data['alpha_degrees'][0] == 10
+
+    lab.close()
+    assert lab not in displayed_labs()
+    assert lab.alpha_slider_widget.comm is None
+
+
+def test_closing_matplotlib_lab_closes_figure(matplotlib_lab):
+    with matplotlib_lab() as lab:
+        assert lab in displayed_labs()
+        assert plt.fignum_exists(lab.fig.number)
+    assert lab not in displayed_labs()
+    assert not plt.fignum_exists(lab.fig.number)
+    assert lab.m_counterweight_widget.comm is None
@@ -0,0 +1,34 @@
+import contextlib
+import importlib
+import io
+
+import numpy as np
+import pytest
+
+
+@pytest.fixture
+def lab_class(monkeypatch):
+    module = importlib.import_module('assets.lib.suspendedobject')
+    monkeypatch.setattr(module, 'display', lambda *args, **kwargs: None)
+    # show() of Bokeh prints its output outside a notebook
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield module.SuspendedObjectLab
+
+
+@pytest.mark.parametrize('height, distance', [(1.2, 6), (0.5, 5)])
+def test_object_on_the_ground_can_be_sent_to_the_browser(lab_class, height, distance):
+    # at or above arctan(height / (distance / 2)) the object rests on the ground and the tension is not defined
+    limit = np.degrees(np.arctan(height / (distance / 2)))
+
+    with lab_class(height=height, distance=distance) as lab:
+        lab.launch()
+        document = lab.object_source.document
+
+        lab.alpha_slider_widget.value = limit + 1
+        document.to_json_string() # raises on NaN, as push_notebook does
+        assert lab.object_source.data['tension'] == [None]
+        assert lab.object_source.data['tension_text'] == ['']
+
+        lab.alpha_slider_widget.value = limit - 1
+        document.to_json_string()
+        assert np.isfinite(lab.object_source.data['tension'][0])
@@ -0,0 +1,25 @@
+import numpy as np
+
+from assets.lib.suspendedobjectanalysis import sample_inputs, propagate_uncertainty
+
+
+def test_samples_are_positive():
+    rng = np.random.default_rng(0)
+    samples = sample_inputs(rng, 10**5, (0.5, 1), (1, 2), 6, (0.1, 0.5))
+    for sample in samples:
+        assert (sample > 0).all()
+    # parameters known exactly are not drawn
+    assert (samples[2] == 6).all()
+
+
+def test_invalid_parameters_are_rejected(capsys):
+    assert propagate_uncertainty(3, 10, 6, 1.2, n_samples=0) is None
+    assert propagate_uncertainty((0, 0.1), 10, 6, 1.2, n_samples=100) is None
+    assert 'must be' in capsys.readouterr().out
+
+
+def test_uncertainty_propagation():
+    results = propagate_uncertainty((3, 0.05), (10, 0.1), 6, (1.2, 0.01), n_samples=10**4, chunk_size=2500, workers=2, seed=0)
+    assert results['angle']['count'] == 10**4
+    low, high = results['angle']['interval_95']
+    assert low < results['angle']['mean'] < high